@@ -1,5 +1,8 @@
+import io
 import os
 import json
+import time
+import random
 import asyncio
 import logging
 import nextcord
@@ -15,10 +18,24 @@ intents.message_content = True  # Enable message content intent
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 # Global variables
-CHECK_INTERVAL = 3600  # 1 hour in seconds
+CHECK_INTERVAL = 3600  # 1 hour in seconds; base interval for each sitemap
+MAX_CHECK_INTERVAL = 6 * CHECK_INTERVAL  # cap for the backoff on unchanged sitemaps
+CHECK_BACKOFF_FACTOR = 1.5
+CHECK_JITTER_FRACTION = 0.1  # spread checks out so sites don't all fire together
+SCHEDULER_TICK = 60  # seconds between looking for sitemaps that are due
 MAX_URLS_TO_DISPLAY = 5
+# Discord message limits
+EMBED_FIELD_LIMIT = 25
+EMBED_FIELD_NAME_LIMIT = 256
+EMBED_FIELD_VALUE_BUDGET = 1000  # stay under the 1024-character field value limit
+EMBED_TOTAL_CHAR_LIMIT = 6000
+MAX_FILES_PER_MESSAGE = 10
 SITEMAP_CONFIG_FILE = 'sitemap_config.json'
 
+# Per-sitemap schedule: monotonic time of the next check and the current interval
+next_check_at = {}
+check_intervals = {}
+
 # Default sitemap URLs
 DEFAULT_SITEMAP_URLS = [
     "https://example.com/sitemap.xml",
@@ -57,19 +74,23 @@ async def on_ready():
     """Called when the bot is ready and connected to Discord"""
     logger.info(f'Bot connected as {bot.user.name} (ID: {bot.user.id})')
     
-    # Create an empty known_urls.json file if it doesn't exist
-    if not os.path.exists('known_urls.json'):
-        with open('known_urls.json', 'w') as f:
-            json.dump({}, f)
-    
     # Start the sitemap check loop
     check_sitemaps_task.start()
 
-@tasks.loop(seconds=CHECK_INTERVAL)
+def schedule_next_check(result: SitemapCheckResult):
+    """Work out when a sitemap is next due: back off while unchanged, reset on new URLs or errors"""
+    sitemap_url = result.sitemap_url
+    if result.new_urls or result.error:
+        interval = CHECK_INTERVAL
+    else:
+        interval = min(check_intervals.get(sitemap_url, CHECK_INTERVAL) * CHECK_BACKOFF_FACTOR, MAX_CHECK_INTERVAL)
+    check_intervals[sitemap_url] = interval
+    next_check_at[sitemap_url] = time.monotonic() + interval + random.uniform(0, CHECK_JITTER_FRACTION) * interval
+    logger.debug(f"Next check of {sitemap_url} in {interval:.0f}s")
+
+@tasks.loop(seconds=SCHEDULER_TICK)
 async def check_sitemaps_task():
-    """Task that runs periodically to check sitemaps for new URLs"""
-    logger.info("Starting scheduled sitemap check")
-    
+    """Task that runs periodically to check the sitemaps that are due for new URLs"""
     try:
         # Read the notification channel ID from environment variable
         channel_id = int(os.environ.get('NOTIFICATION_CHANNEL_ID', 0))
@@ -84,19 +105,33 @@ async def check_sitemaps_task():
         
         # Get the latest sitemap URLs from configuration
         sitemap_urls = get_sitemap_urls()
-        logger.info(f"Checking {len(sitemap_urls)} sitemaps: {sitemap_urls}")
-        
         if not sitemap_urls:
             logger.warning("No sitemap URLs configured")
             return
+        
+        # Forget sitemaps that were removed from the configuration; newly added ones are due at once
+        for sitemap_url in list(next_check_at):
+            if sitemap_url not in sitemap_urls:
+                next_check_at.pop(sitemap_url, None)
+                check_intervals.pop(sitemap_url, None)
+        now = time.monotonic()
+        due = [url for url in sitemap_urls if next_check_at.get(url, 0) <= now]
+        if not due:
+            return
+        
+        logger.info(f"Starting scheduled sitemap check of {len(due)} due sitemaps: {due}")
+        # Push them out by the base interval so a failed run doesn't retry every tick
+        for sitemap_url in due:
+            next_check_at[sitemap_url] = now + CHECK_INTERVAL
             
-        # Check all configured sitemaps
-        results = check_sitemaps(sitemap_urls)
+        # Check the due sitemaps concurrently (natively async, runs on the bot's event loop)
+        results = await check_sitemaps(due, sitemap_urls)
         
-        # Send notifications for sitemaps with new URLs
         for result in results:
-            if result.new_urls:
-                await send_notification(channel, result)
+            schedule_next_check(result)
+        
+        # Send a single batched notification for all sitemaps with new URLs
+        await send_aggregate_notification(channel, results)
                 
         logger.info("Completed scheduled sitemap check")
                 
@@ -108,86 +143,79 @@ async def before_check_sitemaps():
     """Wait for the bot to be ready before starting the task loop"""
     await bot.wait_until_ready()
 
-    async def send_notification(channel, result: SitemapCheckResult):
-        """Send a notification to the specified channel about new URLs"""
-        site_name = result.sitemap_url # Use sitemap URL as identifier for filename
-        # Sanitize site_name to create a valid filename
-        safe_site_name = "".join(c for c in site_name if c.isalnum() or c in ('-', '_')).rstrip()
-        if not safe_site_name: # Handle empty sanitized name
-             safe_site_name = "unknown_site"
-
-        new_urls = result.new_urls
-        num_new_urls = len(new_urls)
-
-        logger.info(f"Preparing notification for {num_new_urls} new URLs from {site_name}")
-
-        if num_new_urls == 0:
-            logger.warning(f"send_notification called with 0 new URLs for {site_name}")
-            return # Nothing to send
-
-        # --- Option 1: Send an embed if few URLs ---
-        if num_new_urls <= MAX_URLS_TO_DISPLAY:
-            displayed_urls = new_urls # Show all if <= MAX_URLS_TO_DISPLAY
-
-            # Create embed for notification
-            embed = nextcord.Embed(
-                title=f"🔎 New URLs Detected",
-                description=f"Found {num_new_urls} new URL(s) in sitemap: {site_name}",
-                color=0x5865F2
-            )
-
-            # Add URLs to the embed
-            url_list_text = ""
-            for url in displayed_urls:
-                line_to_add = f"• <{url}>\n" # Use angle brackets
-                if len(url_list_text) + len(line_to_add) > 1000: # Check length limit
-                    break 
-                url_list_text += line_to_add
-
-            if url_list_text:
-                embed.add_field(name=f"New URLs ({num_new_urls} total):", value=url_list_text, inline=False)
-            else:
-                 embed.add_field(name=f"New URLs ({num_new_urls} total):", value="*(Unable to display URLs due to length)*", inline=False)
-
-            try:
-                await channel.send(embed=embed)
-                logger.info(f"Sent embed notification for {num_new_urls} new URLs from {site_name}")
-            except Exception as e:
-                logger.error(f"Error sending embed notification for {site_name}: {e}", exc_info=True)
-
-        # --- Option 2: Send a file if many URLs ---
-        else:
-            filename = f"new_urls_{safe_site_name[:50]}.txt" # Limit filename length
+def build_url_file(result: SitemapCheckResult):
+    """Build an in-memory .txt attachment listing all new URLs of a sitemap"""
+    # Sanitize the sitemap URL to create a valid filename
+    safe_site_name = "".join(c for c in result.sitemap_url if c.isalnum() or c in ('-', '_')).rstrip()
+    if not safe_site_name: # Handle empty sanitized name
+         safe_site_name = "unknown_site"
+    filename = f"new_urls_{safe_site_name[:50]}.txt" # Limit filename length
+    buf = io.BytesIO(''.join(f"{url}\n" for url in result.new_urls).encode('utf-8'))
+    return nextcord.File(buf, filename=filename)
+
+def format_url_field(result: SitemapCheckResult):
+    """Format the embed field value listing (some of) a sitemap's new URLs"""
+    num_new_urls = len(result.new_urls)
+    url_list_text = ""
+    for url in result.new_urls[:MAX_URLS_TO_DISPLAY]:
+        line_to_add = f"• <{url}>\n" # Use angle brackets
+        if len(url_list_text) + len(line_to_add) > EMBED_FIELD_VALUE_BUDGET: # Check length limit
+            break
+        url_list_text += line_to_add
+    if num_new_urls > MAX_URLS_TO_DISPLAY:
+        url_list_text += "*Full list attached.*"
+    return url_list_text or "*(Unable to display URLs due to length)*"
+
+async def send_aggregate_notification(channel, results):
+    """Send one notification covering every sitemap with new URLs, batched within Discord's message limits"""
+    hits = [result for result in results if result.new_urls]
+    if not hits:
+        return
+    total_new = sum(len(result.new_urls) for result in hits)
+    logger.info(f"Preparing notification for {total_new} new URLs across {len(hits)} sitemaps")
+    
+    title = "🔎 New URLs Detected"
+    description = f"Found {total_new} new URL(s) across {len(hits)} sitemap(s)"
+    
+    # Group the sitemaps into messages that fit Discord's embed limits
+    base_chars = len(title) + len(description) + 32  # leave room for the "Part x of y" footer
+    batches = []
+    batch, batch_chars = [], base_chars
+    for result in hits:
+        name = f"{result.sitemap_url} ({len(result.new_urls)} new)"[:EMBED_FIELD_NAME_LIMIT]
+        value = format_url_field(result)
+        field_chars = len(name) + len(value)
+        if batch and (len(batch) >= EMBED_FIELD_LIMIT or batch_chars + field_chars > EMBED_TOTAL_CHAR_LIMIT):
+            batches.append(batch)
+            batch, batch_chars = [], base_chars
+        batch.append((result, name, value))
+        batch_chars += field_chars
+    batches.append(batch)
+    
+    for index, batch in enumerate(batches):
+        embed = nextcord.Embed(title=title, description=description, color=0x5865F2)
+        if len(batches) > 1:
+            embed.set_footer(text=f"Part {index + 1} of {len(batches)}")
+        files = []
+        for result, name, value in batch:
+            embed.add_field(name=name, value=value, inline=False)
+            if len(result.new_urls) > MAX_URLS_TO_DISPLAY:
+                files.append(build_url_file(result))
+        
+        try:
+            # The embed goes out with the first batch of files; any overflow follows as file-only messages
+            await channel.send(embed=embed, files=files[:MAX_FILES_PER_MESSAGE] or None)
+            for start in range(MAX_FILES_PER_MESSAGE, len(files), MAX_FILES_PER_MESSAGE):
+                await channel.send(files=files[start:start + MAX_FILES_PER_MESSAGE])
+            logger.info(f"Sent notification for {len(batch)} sitemaps with {len(files)} attachments")
+        except Exception as e:
+            logger.error(f"Error sending aggregate notification: {e}", exc_info=True)
+            # Fallback: Try sending a simple text message without the lists
             try:
-                # Create and write all URLs to the file
-                with open(filename, 'w', encoding='utf-8') as f:
-                    for url in new_urls:
-                        f.write(url + '\n')
-
-                # Prepare message and file attachment
-                message_text = f"🔎 Found {num_new_urls} new URLs for {site_name}. Full list attached."
-                discord_file = nextcord.File(filename)
-
-                # Send message with file
-                await channel.send(content=message_text, file=discord_file)
-                logger.info(f"Sent file notification for {num_new_urls} new URLs from {site_name}")
-
-            except Exception as e:
-                logger.error(f"Error creating or sending file notification for {site_name}: {e}", exc_info=True)
-                # Fallback: Try sending a simple text message without the list
-                try:
-                    await channel.send(f"🔎 Found {num_new_urls} new URLs for {site_name}, but failed to attach file.")
-                except Exception as fallback_e:
-                     logger.error(f"Error sending fallback text notification for {site_name}: {fallback_e}", exc_info=True)
-
-            finally:
-                # Clean up the temporary file if it exists
-                if os.path.exists(filename):
-                    try:
-                        os.remove(filename)
-                        logger.info(f"Deleted temporary file: {filename}")
-                    except Exception as e:
-                        logger.error(f"Error deleting temporary file {filename}: {e}")
+                summary = ", ".join(f"{result.sitemap_url} ({len(result.new_urls)})" for result, _, _ in batch)
+                await channel.send(f"🔎 Found new URLs for {summary[:1900]}, but failed to send the details.")
+            except Exception as fallback_e:
+                 logger.error(f"Error sending fallback text notification: {fallback_e}", exc_info=True)
 
 def run_bot():
     """Run the Discord bot using the token from environment variables"""
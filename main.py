@@ -1,4 +1,5 @@
 import os
+import asyncio
 import threading
 import logging
 import json
@@ -48,7 +49,8 @@ def api_check():
         }), 400
         
     try:
-        results = check_sitemaps(sitemap_urls)
+        # check_sitemaps is a coroutine; run it on a fresh loop in this Flask worker thread
+        results = asyncio.run(check_sitemaps(sitemap_urls))
         response = {
             'status': 'success',
             'checked': len(sitemap_urls),
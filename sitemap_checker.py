@@ -1,18 +1,95 @@
 import os
-import requests
+import re
+import sys
 import json
+import time
+import zlib
+import asyncio
+import hashlib
+import tempfile
+import contextvars
 import logging
+import aiohttp
+from contextlib import asynccontextmanager, nullcontext
+from urllib.parse import urlparse, urljoin
 from lxml import etree
 from dataclasses import dataclass
-from typing import List, Set, Dict
+from typing import AsyncIterator, BinaryIO, List, Set, Dict, Optional, Tuple
+
+try:
+    # Either package enables aiohttp's transparent Brotli decoding
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        import brotlicffi  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+try:
+    # orjson is much faster on big documents like the legacy known_urls.json
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Sub-sitemaps being loaded by the current task and its ancestors, used to break index cycles
+sub_sitemap_chain: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar('sub_sitemap_chain', default=())
+
+# Configured URLs that aren't direct sitemap links, mapped to the sitemap discover_sitemap resolved them to
+discovered_sitemaps: Dict[str, str] = {}
+
+# When prune_parsed_cache last walked the cache in this process
+last_parsed_cache_prune = 0.0
+
 # Constants
-KNOWN_URLS_FILE = 'known_urls.json'
+KNOWN_URLS_DIR = 'known_urls'  # one <sha1(sitemap_url)>.txt shard per sitemap
+LEGACY_KNOWN_URLS_FILE = 'known_urls.json'
+PARSED_CACHE_DIR = 'parsed_cache'  # extracted URLs of large documents, keyed by blake2b of the body
+PARSED_CACHE_MIN_BYTES = 64 * 1024  # smaller documents are cheaper to parse than to look up
+PARSED_CACHE_MAX_AGE = 7 * 24 * 3600  # seconds an unused entry is kept
+PARSED_CACHE_PRUNE_INTERVAL = PARSED_CACHE_MAX_AGE / 7  # seconds between cache janitor runs
+PARSED_CACHE_SITEMAP_MARKER = '#sitemap '
+SHARD_SIGNATURE_HEADER = '#sig '  # first line of a shard; URLs never start with '#'
+SHARD_PREFIX_HEADER = '#prefix '
+HTTP_CACHE_FILE = 'http_cache.json'  # ETag/Last-Modified per sitemap URL for conditional GETs
 USER_AGENT = 'Mozilla/5.0 (compatible; SitemapMonitorBot/1.0)'
 REQUEST_TIMEOUT = 30  # seconds
+MAX_CONCURRENT_FETCHES = 32  # upper bound on simultaneous connections per check run
+GZIP_MAGIC = b'\x1f\x8b'
+CONTENT_SNIFF_BYTES = 512  # how much of a body to inspect when guessing its format
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes read from the socket at a time
+SPOOL_MAX_BYTES = 1024 * 1024  # larger bodies are spooled to a temporary file instead of memory
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+# Tags as lxml reports them, also accepting sitemaps that omit the namespace
+SITEMAP_LOC_TAGS = {f'{{{SITEMAP_NS}}}loc', 'loc'}
+SITEMAP_INDEX_TAGS = {f'{{{SITEMAP_NS}}}sitemapindex', 'sitemapindex'}
+
+# Request settings shared by every fetch
+DEFAULT_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'application/xml, text/xml, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': ACCEPT_ENCODING
+}
+# Per-socket timeouts only, so time spent waiting for a pooled connection isn't counted
+CLIENT_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+MAX_RETRIES = 2
+RETRY_BACKOFF_FACTOR = 0.5  # seconds; doubled after every failed attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Precompiled patterns for robots.txt/HTML discovery and the regex parsing fallback
+ROBOTS_SITEMAP_RE = re.compile(r'sitemap:\s*(https?://\S+)', re.IGNORECASE)
+HTML_SITEMAP_HREF_RE = re.compile(r'href=[\'"]([^\'"]*sitemap[^\'"]*\.xml)[\'"]')
+HTML_PAGE_HREF_RE = re.compile(r'href=[\'"]([^\'"]*?(?:\/[^\'"]*?)+?(?:\.html?|\/|\.php))[\'"]')
+LOC_RE = re.compile(rb'<loc>(https?://[^<]+)</loc>')
 
 @dataclass
 class SitemapCheckResult:
@@ -22,223 +99,449 @@ class SitemapCheckResult:
     new_urls: List[str]
     error: str = ""
 
-def load_known_urls() -> Dict[str, List[str]]:
-    """Load the known URLs from the JSON file"""
+@dataclass
+class SitemapBody:
+    """A fetched document, spooled to a temporary file once it gets large"""
+    file: BinaryIO
+    head: bytes  # stripped, lowercased start of the body for format sniffing
+    digest: str  # blake2b of the (decompressed) body
+    size: int
+
+    def rewind(self) -> BinaryIO:
+        """Return the underlying file positioned at the start of the body"""
+        self.file.seek(0)
+        return self.file
+
+    def read(self) -> bytes:
+        """Return the whole body; only for small documents like robots.txt or HTML"""
+        return self.rewind().read()
+
+    def close(self):
+        self.file.close()
+
+class SitemapNotModified(Exception):
+    """Raised when a conditional request for a sitemap returns 304 Not Modified"""
+
+def load_http_cache() -> Dict[str, Dict[str, str]]:
+    """Load the ETag/Last-Modified validators recorded for previously fetched sitemaps"""
     try:
-        if os.path.exists(KNOWN_URLS_FILE):
-            with open(KNOWN_URLS_FILE, 'r') as f:
-                try:
-                    data = json.load(f)
+        if os.path.exists(HTTP_CACHE_FILE):
+            with open(HTTP_CACHE_FILE, 'rb') as f:
+                data = json_loads(f.read())
+                if isinstance(data, dict):
                     return data
-                except json.JSONDecodeError as json_err:
-                    logger.error(f"Invalid JSON in {KNOWN_URLS_FILE}: {str(json_err)}")
-                    # Create a backup of the corrupted file
-                    backup_file = f"{KNOWN_URLS_FILE}.bak"
-                    logger.info(f"Creating backup of corrupted file as {backup_file}")
-                    try:
-                        with open(backup_file, 'w') as backup:
-                            with open(KNOWN_URLS_FILE, 'r') as original:
-                                backup.write(original.read())
-                    except Exception as backup_err:
-                        logger.error(f"Failed to create backup: {str(backup_err)}")
-                    
-                    # Return empty dict to start fresh
-                    return {}
         return {}
     except Exception as e:
-        logger.error(f"Error loading known URLs: {str(e)}")
+        logger.error(f"Error loading HTTP cache, sending unconditional requests: {str(e)}")
         return {}
 
-def save_known_urls(known_urls: Dict[str, List[str]]):
-    """Save the known URLs to the JSON file"""
+def save_http_cache(http_cache: Dict[str, Dict[str, str]]):
+    """Save the HTTP validators to disk"""
     try:
-        # Make sure we have a dictionary
-        if not isinstance(known_urls, dict):
-            logger.error(f"Expected a dictionary for known_urls, got {type(known_urls)}")
-            known_urls = {}
+        # Create a temporary file first to ensure atomic write
+        temp_file = f"{HTTP_CACHE_FILE}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(json_dumps(http_cache))
         
-        # First validate we can actually convert this to JSON
-        try:
-            json_data = json.dumps(known_urls, indent=2)
-        except Exception as json_err:
-            logger.error(f"Cannot serialize known_urls to JSON: {str(json_err)}")
-            return
+        # Then rename it to the actual file
+        os.replace(temp_file, HTTP_CACHE_FILE)
+    except Exception as e:
+        logger.error(f"Error saving HTTP cache: {str(e)}")
+
+def known_urls_shard_path(sitemap_url: str) -> str:
+    """Return the path of the shard file holding the known URLs for one sitemap"""
+    digest = hashlib.sha1(sitemap_url.encode('utf-8')).hexdigest()
+    return os.path.join(KNOWN_URLS_DIR, f"{digest}.txt")
+
+def migrate_legacy_known_urls():
+    """Split the old single known_urls.json file into per-sitemap shards, if not done yet"""
+    if os.path.isdir(KNOWN_URLS_DIR) or not os.path.exists(LEGACY_KNOWN_URLS_FILE):
+        return
+    try:
+        with open(LEGACY_KNOWN_URLS_FILE, 'rb') as f:
+            legacy = json_loads(f.read())
+    except Exception as e:
+        logger.error(f"Could not read legacy {LEGACY_KNOWN_URLS_FILE}, not migrating: {str(e)}")
+        return
+    if not isinstance(legacy, dict):
+        logger.error(f"Expected a dictionary in {LEGACY_KNOWN_URLS_FILE}, got {type(legacy)}")
+        return
+    logger.info(f"Migrating {len(legacy)} sitemaps from {LEGACY_KNOWN_URLS_FILE} to {KNOWN_URLS_DIR}/")
+    os.makedirs(KNOWN_URLS_DIR, exist_ok=True)
+    for sitemap_url, urls in legacy.items():
+        save_known_urls(sitemap_url, {url.strip() for url in urls} - {''})
+
+def load_known_urls(sitemap_url: str) -> Optional[Set[str]]:
+    """Load the known URLs for a sitemap from its shard file, or None if it was never checked"""
+    shard_file = known_urls_shard_path(sitemap_url)
+    try:
+        if os.path.exists(shard_file):
+            with open(shard_file, 'rb') as f:
+                text = f.read().decode('utf-8')
+            # Skip the signature header, then read the shared prefix header
+            header, _, body = text.partition('\n')[2].partition('\n')
+            prefix = header[len(SHARD_PREFIX_HEADER):]
+            # Every suffix line is newline-terminated (a suffix may be empty)
+            return {sys.intern(prefix + suffix) for suffix in body.split('\n')[:-1]}
+        return None
+    except Exception as e:
+        logger.error(f"Error loading known URLs for {sitemap_url}: {str(e)}")
+        return None
+
+def load_known_urls_signature(sitemap_url: str) -> Optional[str]:
+    """Read the url_set_signature from a sitemap's shard header, or None if there is none"""
+    shard_file = known_urls_shard_path(sitemap_url)
+    try:
+        if os.path.exists(shard_file):
+            with open(shard_file, 'rb') as f:
+                header = f.readline().decode('utf-8').rstrip('\n')
+            if header.startswith(SHARD_SIGNATURE_HEADER):
+                return header[len(SHARD_SIGNATURE_HEADER):]
+        return None
+    except Exception as e:
+        logger.error(f"Error reading known URLs signature for {sitemap_url}: {str(e)}")
+        return None
+
+def url_set_signature(urls: Set[str]) -> str:
+    """Return an order-independent fingerprint of a URL set that is stable across processes"""
+    xor_total = 0
+    sum_total = 0
+    for url in urls:
+        crc = zlib.crc32(url.encode('utf-8'))
+        xor_total ^= crc
+        sum_total += crc
+    return f"{len(urls)}:{xor_total:08x}:{sum_total & 0xFFFFFFFFFFFFFFFF:016x}"
+
+def signature_url_count(signature: str) -> int:
+    """Return the URL count encoded in a url_set_signature"""
+    return int(signature.split(':', 1)[0])
+
+def save_known_urls(sitemap_url: str, urls: Set[str], signature: Optional[str] = None) -> bool:
+    """Save the known URLs for a sitemap to its shard file, returning whether it was written"""
+    try:
+        if signature is None:
+            signature = url_set_signature(urls)
+        sorted_urls = sorted(urls)
+        # For sorted strings, the common prefix of the first and last covers them all
+        prefix = os.path.commonprefix([sorted_urls[0], sorted_urls[-1]]) if sorted_urls else ''
+        cut = len(prefix)
+        # Signature header, shared prefix header, then one newline-terminated suffix per URL
+        data = (SHARD_SIGNATURE_HEADER + signature + '\n' +
+                SHARD_PREFIX_HEADER + prefix + '\n' +
+                ''.join(f"{url[cut:]}\n" for url in sorted_urls)).encode('utf-8')
+        
+        os.makedirs(KNOWN_URLS_DIR, exist_ok=True)
+        shard_file = known_urls_shard_path(sitemap_url)
         
         # Create a temporary file first to ensure atomic write
-        temp_file = f"{KNOWN_URLS_FILE}.tmp"
-        with open(temp_file, 'w') as f:
-            f.write(json_data)
+        temp_file = f"{shard_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(data)
         
         # Then rename it to the actual file
-        import os
-        os.replace(temp_file, KNOWN_URLS_FILE)
+        os.replace(temp_file, shard_file)
+        return True
         
     except Exception as e:
-        logger.error(f"Error saving known URLs: {str(e)}")
+        logger.error(f"Error saving known URLs for {sitemap_url}: {str(e)}")
+        return False
 
-def fetch_sitemap(url: str, from_robots_redirect: bool = False) -> str:
-    """Fetch a sitemap from the given URL
+@asynccontextmanager
+async def request_sitemap(session: aiohttp.ClientSession, url: str,
+                          headers: Dict[str, str] = DEFAULT_HEADERS) -> AsyncIterator[aiohttp.ClientResponse]:
+    """GET a URL through the shared session, retrying transient failures with backoff"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await session.get(url, headers=headers, timeout=CLIENT_TIMEOUT)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.warning(f"Request to {url} failed ({str(e)}), retrying")
+        else:
+            if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                break
+            logger.warning(f"Request to {url} returned {response.status}, retrying")
+            response.release()
+        await asyncio.sleep(RETRY_BACKOFF_FACTOR * 2 ** attempt)
+    
+    try:
+        yield response
+    finally:
+        response.release()
+
+async def read_sitemap_body(response: aiohttp.ClientResponse) -> SitemapBody:
+    """Stream a response body into a spooled SitemapBody, decompressing .xml.gz files on the way"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    hasher = hashlib.blake2b(digest_size=16)
+    decompressor = None
+    head = b''
+    size = 0
+    first = True
+    loop = asyncio.get_running_loop()
+
+    def spool_chunk(data: bytes) -> bytes:
+        if decompressor:
+            data = decompressor.decompress(data) if data else decompressor.flush()
+        hasher.update(data)
+        spool.write(data)
+        return data
+
+    try:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if first:
+                first = False
+                if chunk[:2] == GZIP_MAGIC:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            # Past the spool threshold writes hit disk, so keep them and the inflate off the event loop
+            if size < SPOOL_MAX_BYTES:
+                data = spool_chunk(chunk)
+            else:
+                data = await loop.run_in_executor(None, spool_chunk, chunk)
+            if len(head) < CONTENT_SNIFF_BYTES:
+                head += data[:CONTENT_SNIFF_BYTES - len(head)]
+            size += len(data)
+        if decompressor:
+            if size < SPOOL_MAX_BYTES:
+                size += len(spool_chunk(b''))
+            else:
+                size += len(await loop.run_in_executor(None, spool_chunk, b''))
+    except BaseException:
+        spool.close()
+        raise
+    return SitemapBody(file=spool, head=content_head(head), digest=hasher.hexdigest(), size=size)
+
+async def fetch_sitemap(session: aiohttp.ClientSession, url: str,
+                        validators: Optional[Dict[str, str]] = None) -> SitemapBody:
+    """Fetch a sitemap from the given URL, discovering it first unless it's a direct .xml link
     
     Args:
+        session: The shared aiohttp session to issue requests with
         url: The URL to fetch
-        from_robots_redirect: Set to True if this call resulted from a robots.txt lookup
-                             to prevent infinite recursion
+        validators: Optional HTTP cache entry for this sitemap; makes the request
+                    conditional (a 304 raises SitemapNotModified) and is updated in place
     """
-    headers = {
-        'User-Agent': USER_AGENT,
-        'Accept': 'application/xml, text/xml, */*',
-        'Accept-Language': 'en-US,en;q=0.9'
-    }
+    sitemap_url = discovered_sitemaps.get(url)
+    body = None
+    if sitemap_url is None and url.endswith(('.xml', '.xml.gz')):
+        body = await fetch_sitemap_document(session, url, validators)
+        if not looks_like_html(body.head):
+            return body
     
+    try:
+        if body is not None:
+            # A .xml URL serving HTML (a CMS page or soft 404): look for the real sitemap from there
+            sitemap_url, body = await discover_sitemap_in_html(session, url, body)
+        elif sitemap_url is None:
+            sitemap_url, body = await discover_sitemap(session, url, validators)
+        if body is None:
+            body = await fetch_sitemap_document(session, sitemap_url, validators)
+    except SitemapNotModified as not_modified:
+        # Raised with the URL that answered 304, which is the sitemap to use
+        discovered_sitemaps[url] = not_modified.args[0]
+        raise
+    except Exception:
+        # The site may have moved its sitemap, so look it up again next time
+        discovered_sitemaps.pop(url, None)
+        raise
+    discovered_sitemaps[url] = sitemap_url
+    return body
+
+async def fetch_sitemap_document(session: aiohttp.ClientSession, url: str,
+                                 validators: Optional[Dict[str, str]] = None) -> SitemapBody:
+    """Fetch a known sitemap URL as is, with no discovery heuristics"""
+    try:
+        logger.info(f"Sending request to {url}")
+        request_headers = DEFAULT_HEADERS
+        if validators and validators.get('url') == url:
+            request_headers = dict(DEFAULT_HEADERS)
+            if validators.get('etag'):
+                request_headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                request_headers['If-Modified-Since'] = validators['last_modified']
+        
+        async with request_sitemap(session, url, request_headers) as response:
+            if response.status == 304:
+                logger.info(f"{url} not modified since last check")
+                raise SitemapNotModified(url)
+            
+            response.raise_for_status()  # Raise exception for 4XX/5XX responses
+            
+            # Check content type (media types are sent in lowercase in practice)
+            content_type = response.headers.get('Content-Type', '')
+            if 'xml' not in content_type and 'text/plain' not in content_type:
+                logger.warning(f"Response content type '{content_type}' may not be a proper sitemap format")
+            
+            body = await read_sitemap_body(response)
+            
+            if validators is not None:
+                # Only a plain <urlset> fully determines its URLs; an index's children can
+                # change without the index itself changing, so never short-circuit those
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                validators.clear()
+                if (etag or last_modified) and b'<urlset' in body.head:
+                    validators.update(url=url, etag=etag, last_modified=last_modified)
+        return body
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching sitemap {url}: {str(e)}")
+        raise
+
+async def discover_sitemap(session: aiohttp.ClientSession, url: str,
+                           validators: Optional[Dict[str, str]] = None) -> Tuple[str, Optional[SitemapBody]]:
+    """Resolve a URL that isn't a direct .xml link to its sitemap, plus the probed body if it is the sitemap"""
     # Special handling for known domains
-    from urllib.parse import urlparse
     parsed_url = urlparse(url)
     domain = parsed_url.netloc.lower()
-    
-    # Initialize special_case to False as the default
-    special_case = False
+    lower_url = url.lower()
     
     # Site-specific fixes
-    if domain == 'github.com' and not 'sitemap' in url.lower():
+    if domain == 'github.com' and 'sitemap' not in lower_url:
         # GitHub doesn't have traditional sitemaps and blocks automated requests to /sitemap.xml
         logger.info(f"GitHub detected. GitHub restricts sitemap access, using direct page approach")
-        
-        # Don't try to append sitemap.xml - this is a special case
-        special_case = True
-        
-        # Just use the home page directly
-        url = "https://github.com/"
+        url = lower_url = "https://github.com/"
         logger.info(f"Using GitHub homepage directly: {url}")
     elif domain == 'twitter.com' or domain == 'x.com':
         logger.warning(f"Twitter/X doesn't provide public sitemaps")
-        raise requests.RequestException("This site doesn't provide public sitemaps")
+        raise aiohttp.ClientError("This site doesn't provide public sitemaps")
     elif domain == 'google.com' or domain == 'www.google.com':
         # Google has multiple sitemaps for different services
         logger.info(f"Google detected, using Google Search sitemap")
-        url = "https://www.google.com/sitemap.xml"
+        return "https://www.google.com/sitemap.xml", None
+    elif 'sitemap' not in lower_url and 'robots.txt' not in lower_url:
+        # URL is missing the sitemap path, try the conventional location
+        sitemap_url = f"{url}sitemap.xml" if url.endswith('/') else f"{url}/sitemap.xml"
+        logger.info(f"URL doesn't appear to be a sitemap URL, trying {sitemap_url} instead of {url}")
+        return sitemap_url, None
     
-    # Check if URL is missing the sitemap path and try to auto-fix common patterns 
-    original_url = url
-    if not url.endswith('.xml') and 'sitemap' not in url.lower() and 'robots.txt' not in url.lower() and not special_case:
-        # If URL ends with /, append sitemap.xml
-        if url.endswith('/'):
-            url = f"{url}sitemap.xml"
-        else:
-            url = f"{url}/sitemap.xml"
-        logger.info(f"URL doesn't appear to be a sitemap URL, trying {url} instead of {original_url}")
+    logger.info(f"Probing {url} to find its sitemap")
+    # The probe is conditional when the validators belong to this URL, so a
+    # sitemap served from it directly is answered by a 304 when unchanged
+    probe_validators = validators if not validators or validators.get('url') == url else None
+    body = await fetch_sitemap_document(session, url, probe_validators)
     
     try:
-        logger.info(f"Sending request to {url}")
-        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-        
-        # Check content type
-        content_type = response.headers.get('Content-Type', '')
-        if not ('xml' in content_type.lower() or 'text/plain' in content_type.lower()):
-            logger.warning(f"Response content type '{content_type}' may not be a proper sitemap format")
-        
-        response.raise_for_status()  # Raise exception for 4XX/5XX responses
-        
         # Handle robots.txt special case
-        content = response.text
-        if 'robots.txt' in url.lower():
-            import re
+        if 'robots.txt' in lower_url:
             logger.info("Parsing robots.txt to find sitemap references")
-            sitemap_urls = re.findall(r'(?i)sitemap:\s*(https?://\S+)', content)
-            if sitemap_urls:
-                logger.info(f"Found {len(sitemap_urls)} sitemap(s) in robots.txt")
-                sitemap_url = sitemap_urls[0]
-                logger.info(f"Using first sitemap from robots.txt: {sitemap_url}")
-                # Prevent infinite recursion by checking if we're already looking at a robots.txt
-                if from_robots_redirect:
-                    logger.warning("Already redirected from robots.txt, not following another redirect to avoid recursion")
-                    # Just extract urls from this content
-                    return content
-                else:
-                    # It's safe to follow this redirect but set maximum recursion to 1 level
-                    logger.info("Following sitemap from robots.txt (one level only)")
-                    try:
-                        new_content = fetch_sitemap(sitemap_url, from_robots_redirect=True)
-                        return new_content
-                    except Exception as e:
-                        logger.error(f"Error following robots.txt redirect: {str(e)}")
-                        # Just return the original content if there's an error
-                        return content
-            else:
+            sitemap_urls = ROBOTS_SITEMAP_RE.findall(body.read().decode('utf-8', errors='replace'))
+            if not sitemap_urls:
                 logger.warning("No sitemaps found in robots.txt")
-                raise requests.RequestException("No sitemaps found in robots.txt")
+                raise aiohttp.ClientError("No sitemaps found in robots.txt")
+            logger.info(f"Found {len(sitemap_urls)} sitemap(s) in robots.txt, using the first: {sitemap_urls[0]}")
+            return sitemap_urls[0], None
         
-        # Quick check if content looks like XML
-        if '<?xml' not in content and '<urlset' not in content and '<sitemapindex' not in content:
-            logger.warning("Response doesn't appear to contain valid sitemap XML")
-            
-            # Try to find a link to sitemap if this is an HTML page
-            if '<html' in content.lower():
-                import re
-                logger.info("Received HTML instead of XML, looking for sitemap link in HTML...")
-                
-                # Look for sitemap link in HTML
-                sitemap_links = re.findall(r'href=[\'"]([^\'"]*sitemap[^\'"]*\.xml)[\'"]', content)
-                if sitemap_links:
-                    sitemap_link = sitemap_links[0]
-                    logger.info(f"Found sitemap link in HTML: {sitemap_link}")
-                    
-                    # Make sure the link is absolute
-                    if sitemap_link.startswith('/'):
-                        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                        sitemap_link = f"{base_url}{sitemap_link}"
-                    
-                    # Try to fetch the actual sitemap
-                    logger.info(f"Attempting to fetch sitemap from link: {sitemap_link}")
-                    return fetch_sitemap(sitemap_link)
-                
-                # If no sitemap links found in HTML, try to fetch robots.txt
-                # But only if we haven't already tried robots.txt to avoid infinite recursion
-                if not url.endswith('robots.txt') and not from_robots_redirect:
-                    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
-                    logger.info(f"No sitemap links found in HTML, checking robots.txt at {robots_url}")
-                    try:
-                        # Try to fetch robots.txt directly without recursion
-                        robots_response = requests.get(robots_url, headers=headers, timeout=REQUEST_TIMEOUT)
-                        robots_content = robots_response.text
-                        
-                        # Parse robots.txt for sitemap references
-                        import re
-                        sitemap_refs = re.findall(r'(?i)sitemap:\s*(https?://\S+)', robots_content)
-                        if sitemap_refs:
-                            sitemap_ref = sitemap_refs[0]
-                            logger.info(f"Found sitemap in robots.txt: {sitemap_ref}")
-                            # Fetch this sitemap directly
-                            try:
-                                direct_sitemap_response = requests.get(sitemap_ref, headers=headers, timeout=REQUEST_TIMEOUT)
-                                return direct_sitemap_response.text
-                            except Exception as direct_e:
-                                logger.error(f"Error fetching sitemap from robots.txt: {str(direct_e)}")
-                        else:
-                            logger.info("No sitemap references found in robots.txt")
-                    except requests.RequestException as e:
-                        logger.error(f"Failed to fetch robots.txt: {str(e)}")
-            
-        return content
-    except requests.RequestException as e:
-        logger.error(f"Error fetching sitemap {url}: {str(e)}")
-        raise
+        # Hand the probed body over instead of closing it
+        probed, body = body, None
+        if not looks_like_html(probed.head):
+            return url, probed
+        return await discover_sitemap_in_html(session, url, probed)
+    finally:
+        if body is not None:
+            body.close()
 
-def parse_sitemap(sitemap_content: str) -> Set[str]:
-    """Parse the sitemap content and extract URLs"""
+async def discover_sitemap_in_html(session: aiohttp.ClientSession, url: str,
+                                   body: SitemapBody) -> Tuple[str, Optional[SitemapBody]]:
+    """Find the sitemap an HTML page links to or its robots.txt names, falling back to the page itself"""
+    parsed_url = urlparse(url)
+    try:
+        logger.info("Received HTML instead of XML, looking for sitemap link in HTML...")
+        
+        # Look for sitemap link in HTML
+        sitemap_links = HTML_SITEMAP_HREF_RE.findall(body.read().decode('utf-8', errors='replace'))
+        if sitemap_links:
+            sitemap_link = sitemap_links[0]
+            logger.info(f"Found sitemap link in HTML: {sitemap_link}")
+            # Make sure the link is absolute
+            if sitemap_link.startswith('/'):
+                sitemap_link = f"{parsed_url.scheme}://{parsed_url.netloc}{sitemap_link}"
+            return sitemap_link, None
+        
+        # If no sitemap links found in HTML, try robots.txt
+        robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
+        logger.info(f"No sitemap links found in HTML, checking robots.txt at {robots_url}")
+        try:
+            async with request_sitemap(session, robots_url) as robots_response:
+                robots_content = (await robots_response.read()).decode('utf-8', errors='replace')
+            sitemap_refs = ROBOTS_SITEMAP_RE.findall(robots_content)
+            if sitemap_refs:
+                logger.info(f"Found sitemap in robots.txt: {sitemap_refs[0]}")
+                return sitemap_refs[0], None
+            logger.info("No sitemap references found in robots.txt")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Failed to fetch robots.txt: {str(e)}")
+        
+        # Fall back to the page itself; extract_urls scrapes its links
+        probed, body = body, None
+        return url, probed
+    finally:
+        if body is not None:
+            body.close()
+
+def content_head(content: bytes) -> bytes:
+    """Return the lowercased start of a response body for cheap format sniffing"""
+    return content[:CONTENT_SNIFF_BYTES].lstrip().lower()
+
+def looks_like_html(head: bytes) -> bool:
+    """Tell from a body's content_head whether it is an HTML page rather than sitemap XML"""
+    return b'<html' in head and b'<?xml' not in head and b'<urlset' not in head and b'<sitemapindex' not in head
+
+class SitemapTarget:
+    """lxml parser target collecting <loc> entries in a single pass, without building a tree"""
+    
+    def __init__(self):
+        self.page_urls: Set[str] = set()
+        self.sub_sitemaps: List[str] = []
+        self.is_index = False
+        self.in_loc = False
+        self.buffer: List[str] = []
+    
+    def start(self, tag, attrib):
+        if tag in SITEMAP_LOC_TAGS:
+            self.in_loc = True
+            self.buffer = []
+        elif tag in SITEMAP_INDEX_TAGS:
+            self.is_index = True
+    
+    def data(self, data):
+        if self.in_loc:
+            self.buffer.append(data)
+    
+    def end(self, tag):
+        if self.in_loc:
+            self.in_loc = False
+            loc = ''.join(self.buffer).strip()
+            if loc:
+                if self.is_index:
+                    self.sub_sitemaps.append(sys.intern(loc))
+                else:
+                    self.page_urls.add(sys.intern(loc))
+    
+    def close(self) -> Tuple[Set[str], List[str]]:
+        return self.page_urls, self.sub_sitemaps
+
+def extract_sitemap_locs(source: BinaryIO) -> Tuple[Set[str], List[str]]:
+    """Extract page URLs and sub-sitemap URLs from sitemap XML without building a tree"""
+    parser = etree.XMLParser(target=SitemapTarget())
+    for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+        parser.feed(chunk)
+    return parser.close()
+
+async def extract_urls(body: SitemapBody) -> Tuple[Set[str], List[str]]:
+    """Extract page URLs and sub-sitemap URLs from a single fetched document"""
     urls = set()
+    head = body.head
     
     # Special case handling for HTML pages that aren't XML sitemaps
-    if '<html' in sitemap_content.lower() and ('<?xml' not in sitemap_content and '<urlset' not in sitemap_content):
+    if looks_like_html(head):
         logger.info("Content appears to be HTML, extracting URLs from HTML")
-        import re
+        html_content = body.read().decode('utf-8', errors='replace')
         # Extract all URLs from HTML content that look like real pages (not assets, etc)
-        html_urls = re.findall(r'href=[\'"]([^\'"]*?(?:\/[^\'"]*?)+?(?:\.html?|\/|\.php))[\'"]', sitemap_content)
+        html_urls = HTML_PAGE_HREF_RE.findall(html_content)
         if html_urls:
             logger.info(f"Extracted {len(html_urls)} URLs from HTML content")
             
             # Process URLs to make them absolute if needed
-            from urllib.parse import urlparse, urljoin
-            parsed_content_url = urlparse(sitemap_content[:1000])  # Use first 1000 chars to try to find base URL
+            parsed_content_url = urlparse(html_content[:1000])  # Use first 1000 chars to try to find base URL
             if parsed_content_url.netloc:
                 base_url = f"{parsed_content_url.scheme}://{parsed_content_url.netloc}"
             else:
@@ -253,119 +556,323 @@ def parse_sitemap(sitemap_content: str) -> Set[str]:
                 elif url.startswith(('http://', 'https://')):
                     urls.add(url)
             
-            return urls
+            return urls, []
     
     try:
-        # Parse XML
-        root = etree.fromstring(sitemap_content.encode('utf-8'))
-        
-        # Check if this is a sitemap index
-        is_index = root.tag.endswith('sitemapindex')
-        
-        if is_index:
-            # This is a sitemap index, so extract URLs of sub-sitemaps
-            namespaces = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            for sitemap in root.xpath('//sm:sitemap/sm:loc/text()', namespaces=namespaces):
-                try:
-                    sub_sitemap_content = fetch_sitemap(sitemap)
-                    sub_urls = parse_sitemap(sub_sitemap_content)
-                    urls.update(sub_urls)
-                except Exception as sub_e:
-                    logger.error(f"Error processing sub-sitemap {sitemap}: {str(sub_e)}")
-                    # Continue with other sub-sitemaps instead of failing completely
-        else:
-            # This is a standard sitemap, extract URLs
-            namespaces = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            for url in root.xpath('//sm:url/sm:loc/text()', namespaces=namespaces):
-                urls.add(url)
+        # Parse XML in the default executor so large documents don't stall the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, extract_sitemap_locs_cached, body)
     
     except Exception as e:
         logger.error(f"Error parsing sitemap XML: {str(e)}")
         # Instead of failing completely, try to fall back to regex-based parsing
-        import re
         logger.info("Attempting fallback to regex-based parsing")
         # Try to extract URLs with a simple regex
-        all_urls = re.findall(r'<loc>(https?://[^<]+)</loc>', sitemap_content)
+        all_urls = LOC_RE.findall(body.read())
         if all_urls:
             logger.info(f"Regex fallback found {len(all_urls)} URLs")
-            urls.update(all_urls)
+            urls.update(url.decode('utf-8', errors='replace').strip() for url in all_urls)
         else:
             # If regex fallback also fails, then raise the original exception
             raise
     
-    return urls
+    return urls, []
 
-def check_sitemaps(sitemap_urls: List[str]) -> List[SitemapCheckResult]:
-    """Check all sitemaps for new URLs and return results"""
-    results = []
+async def fetch_sitemap_locs(session: aiohttp.ClientSession, sitemap_url: str,
+                             validators: Optional[Dict[str, str]] = None,
+                             limit: Optional[asyncio.Semaphore] = None) -> Tuple[Set[str], List[str]]:
+    """Fetch a document and extract its own page and sub-sitemap URLs, holding limit if given"""
+    async with limit or nullcontext():
+        body = await fetch_sitemap(session, sitemap_url, validators=validators)
+        try:
+            return await extract_urls(body)
+        finally:
+            body.close()
+
+def parsed_cache_path(digest: str) -> str:
+    """Return the cache file for a document, addressed by the hash of its bytes"""
+    return os.path.join(PARSED_CACHE_DIR, digest[:2], digest[2:])
+
+def extract_sitemap_locs_cached(body: SitemapBody) -> Tuple[Set[str], List[str]]:
+    """extract_sitemap_locs, backed by an on-disk cache keyed by content hash"""
+    if body.size < PARSED_CACHE_MIN_BYTES:
+        return extract_sitemap_locs(body.rewind())
     
-    # Start with a clean new state for the first run
-    if not os.path.exists(KNOWN_URLS_FILE):
-        known_urls = {}
-    else:
+    cache_file = parsed_cache_path(body.digest)
+    try:
+        with open(cache_file, 'rb') as f:
+            lines = f.read().decode('utf-8').split('\n')[:-1]
+        # Touch the entry so the janitor keeps documents that are still being served
+        os.utime(cache_file)
+        page_urls = set()
+        sub_sitemaps = []
+        for line in lines:
+            if line.startswith(PARSED_CACHE_SITEMAP_MARKER):
+                sub_sitemaps.append(line[len(PARSED_CACHE_SITEMAP_MARKER):])
+            else:
+                page_urls.add(sys.intern(line))
+        logger.debug(f"Parsed sitemap cache hit: {cache_file}")
+        return page_urls, sub_sitemaps
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error reading parsed sitemap cache {cache_file}: {str(e)}")
+    
+    page_urls, sub_sitemaps = extract_sitemap_locs(body.rewind())
+    try:
+        data = (''.join(f"{url}\n" for url in page_urls) +
+                ''.join(f"{PARSED_CACHE_SITEMAP_MARKER}{url}\n" for url in sub_sitemaps)).encode('utf-8')
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # Create a temporary file first to ensure atomic write
+        temp_file = f"{cache_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        os.replace(temp_file, cache_file)
+    except Exception as e:
+        logger.error(f"Error writing parsed sitemap cache {cache_file}: {str(e)}")
+    return page_urls, sub_sitemaps
+
+def prune_parsed_cache(max_age: float = PARSED_CACHE_MAX_AGE):
+    """Delete parsed-sitemap cache entries (and stray .tmp files) not used for max_age seconds"""
+    if not os.path.isdir(PARSED_CACHE_DIR):
+        return
+    cutoff = time.time() - max_age
+    removed = 0
+    for dirpath, _, filenames in os.walk(PARSED_CACHE_DIR):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Error pruning parsed sitemap cache entry {path}: {str(e)}")
+    if removed:
+        logger.info(f"Pruned {removed} stale parsed sitemap cache entries")
+
+async def parse_sub_sitemaps(session: aiohttp.ClientSession, sub_sitemaps: List[str],
+                             sub_sitemap_cache: Optional[Dict[str, asyncio.Future]] = None,
+                             sub_sitemap_limit: Optional[asyncio.Semaphore] = None) -> Tuple[Set[str], List[str]]:
+    """Fetch and parse sub-sitemaps concurrently, returning their URLs and the sub-sitemaps that failed"""
+    urls = set()
+    failed = []
+    for sub_urls, sub_failed in await asyncio.gather(*(parse_sub_sitemap(session, sitemap, sub_sitemap_cache, sub_sitemap_limit)
+                                                       for sitemap in sub_sitemaps)):
+        urls.update(sub_urls)
+        failed.extend(sub_failed)
+    return urls, failed
+
+async def parse_sub_sitemap(session: aiohttp.ClientSession, sitemap_url: str,
+                            sub_sitemap_cache: Optional[Dict[str, asyncio.Future]] = None,
+                            sub_sitemap_limit: Optional[asyncio.Semaphore] = None) -> Tuple[Set[str], List[str]]:
+    """Fetch and parse a sub-sitemap once per run, returning its URLs and the sub-sitemaps that failed"""
+    chain = sub_sitemap_chain.get()
+    if sitemap_url in chain:
+        logger.warning(f"Sub-sitemap {sitemap_url} references itself through {chain}, skipping")
+        return set(), []
+    
+    try:
+        if sub_sitemap_cache is None:
+            page_urls, sub_sitemaps = await fetch_sitemap_locs(session, sitemap_url, limit=sub_sitemap_limit)
+        else:
+            task = sub_sitemap_cache.get(sitemap_url)
+            if task is None:
+                task = asyncio.ensure_future(fetch_sitemap_locs(session, sitemap_url, limit=sub_sitemap_limit))
+                sub_sitemap_cache[sitemap_url] = task
+            else:
+                logger.debug(f"Reusing sub-sitemap {sitemap_url} already fetched this run")
+            # Shield the shared task so one cancelled caller doesn't cancel it for the others
+            page_urls, sub_sitemaps = await asyncio.shield(task)
+    except Exception as sub_e:
+        # Continue with the other sub-sitemaps; the caller keeps this one's known URLs
+        logger.error(f"Error processing sub-sitemap {sitemap_url}: {str(sub_e)}")
+        return set(), [sitemap_url]
+    
+    # Cached sets are shared between callers, so copy before adding nested URLs
+    urls = set(page_urls)
+    failed = []
+    if sub_sitemaps:
+        sub_sitemap_chain.set(chain + (sitemap_url,))
         try:
-            known_urls = load_known_urls()
-        except Exception as e:
-            logger.error(f"Error loading known URLs, starting fresh: {str(e)}")
-            known_urls = {}
+            sub_urls, failed = await parse_sub_sitemaps(session, sub_sitemaps, sub_sitemap_cache, sub_sitemap_limit)
+            urls.update(sub_urls)
+        finally:
+            sub_sitemap_chain.set(chain)
+    return urls, failed
+
+async def parse_sitemap(session: aiohttp.ClientSession, sitemap_url: str,
+                        validators: Optional[Dict[str, str]] = None,
+                        sub_sitemap_cache: Optional[Dict[str, asyncio.Future]] = None,
+                        sub_sitemap_limit: Optional[asyncio.Semaphore] = None) -> Tuple[Set[str], List[str]]:
+    """Fetch a sitemap and extract its URLs following any sub-sitemaps, plus the sub-sitemaps that failed"""
+    urls, sub_sitemaps = await fetch_sitemap_locs(session, sitemap_url, validators)
+    failed = []
     
-    for sitemap_url in sitemap_urls:
-        result = SitemapCheckResult(
-            sitemap_url=sitemap_url,
-            total_urls=0,
-            new_urls=[]
-        )
-        
+    if sub_sitemaps:
+        # This is a sitemap index, fetch all sub-sitemaps concurrently, then union their URL sets
+        sub_urls, failed = await parse_sub_sitemaps(session, sub_sitemaps, sub_sitemap_cache, sub_sitemap_limit)
+        urls.update(sub_urls)
+    
+    return urls, failed
+
+async def check_one(session: aiohttp.ClientSession, sitemap_url: str, previous_signature: Optional[str],
+                    http_cache: Optional[Dict[str, Dict[str, str]]] = None,
+                    sub_sitemap_cache: Optional[Dict[str, asyncio.Future]] = None,
+                    sub_sitemap_limit: Optional[asyncio.Semaphore] = None
+                    ) -> Tuple[SitemapCheckResult, Optional[Set[str]], Optional[str]]:
+    """Check a single sitemap against its known URLs, returning the result and any shard update"""
+    loop = asyncio.get_running_loop()
+    if http_cache is not None:
+        # Conditional requests only make sense if the shard from last time is intact
+        if previous_signature is None:
+            http_cache[sitemap_url] = {}
+        validators = http_cache.setdefault(sitemap_url, {})
+    else:
+        validators = None
+    
+    result = SitemapCheckResult(
+        sitemap_url=sitemap_url,
+        total_urls=0,
+        new_urls=[]
+    )
+    updated_urls = None
+    updated_signature = None
+    
+    try:
+        # Fetch and parse sitemap
+        logger.info(f"Fetching sitemap from {sitemap_url}")
         try:
-            # Fetch and parse sitemap
-            logger.info(f"Fetching sitemap from {sitemap_url}")
-            try:
-                sitemap_content = fetch_sitemap(sitemap_url)
-                current_urls = parse_sitemap(sitemap_content)
-            except Exception as fetch_err:
-                # Log and propagate the error
-                logger.error(f"Error fetching/parsing sitemap {sitemap_url}: {str(fetch_err)}")
-                result.error = str(fetch_err)
-                results.append(result)
-                continue
-                
-            result.total_urls = len(current_urls)
-            
-            # Check for new URLs
-            if sitemap_url not in known_urls:
-                logger.info(f"First time checking {sitemap_url}, storing all URLs as known")
-                known_urls[sitemap_url] = []
-            
-            previous_urls = set(known_urls[sitemap_url])
-            new_urls = current_urls - previous_urls
+            current_urls, failed_sub_sitemaps = await parse_sitemap(session, sitemap_url, validators,
+                                                                    sub_sitemap_cache, sub_sitemap_limit)
+        except SitemapNotModified:
+            # Unchanged since the last 200, which was already merged into the known URLs
+            result.total_urls = signature_url_count(previous_signature)
+            logger.info(f"Checked {sitemap_url}: not modified, {result.total_urls} known URLs")
+            return result, None, None
+        except Exception as fetch_err:
+            # Log and propagate the error
+            logger.error(f"Error fetching/parsing sitemap {sitemap_url}: {str(fetch_err)}")
+            result.error = str(fetch_err)
+            if validators:
+                # This response never made it into the known URLs, so don't trust it next time
+                validators.clear()
+            return result, None, None
             
+        result.total_urls = len(current_urls)
+        if failed_sub_sitemaps:
+            # Reported as a warning; the rest of the index is still checked below
+            result.error = f"{len(failed_sub_sitemaps)} sub-sitemap(s) could not be fetched: {', '.join(failed_sub_sitemaps)}"
+        current_signature = await loop.run_in_executor(None, url_set_signature, current_urls)
+        
+        # Same URL set as the stored shard: skip loading it and the set diff entirely
+        if current_signature == previous_signature:
+            logger.info(f"Checked {sitemap_url}: found {len(current_urls)} URLs, unchanged")
+            return result, None, None
+        
+        previous_urls = await loop.run_in_executor(None, load_known_urls, sitemap_url)
+        
+        # Check for new URLs
+        if previous_urls is None:
+            logger.info(f"First time checking {sitemap_url}, storing all URLs as known")
+            previous_urls = set()
+            updated_urls, updated_signature = current_urls, current_signature
+        
+        new_urls = current_urls - previous_urls
+        
+        if failed_sub_sitemaps:
+            # The failed sub-sitemaps' URLs are missing, not removed: keep them so
+            # they aren't reported as new again once those sub-sitemaps load
+            removed_urls = set()
+            if new_urls:
+                updated_urls = previous_urls | current_urls
+                updated_signature = await loop.run_in_executor(None, url_set_signature, updated_urls)
+        else:
             # Also check for removed URLs
             removed_urls = previous_urls - current_urls
             if removed_urls:
                 logger.info(f"Found {len(removed_urls)} URLs that were removed from {sitemap_url}")
             
-            if new_urls:
-                result.new_urls = list(new_urls)
-                # Update known URLs with the current set
-                known_urls[sitemap_url] = list(current_urls)
-                logger.info(f"Found {len(new_urls)} new URLs in {sitemap_url}")
-                logger.debug(f"New URLs: {new_urls}")
-            else:
-                logger.info(f"No new URLs found in {sitemap_url}")
-            
-            logger.info(f"Checked {sitemap_url}: found {len(current_urls)} URLs, {len(new_urls)} new, {len(removed_urls)} removed")
-            
-        except Exception as e:
-            result.error = str(e)
-            logger.error(f"Error checking sitemap {sitemap_url}: {str(e)}", exc_info=True)
+            if new_urls or removed_urls:
+                # Update known URLs with the current set so the stored signature matches it again
+                updated_urls, updated_signature = current_urls, current_signature
         
+        if new_urls:
+            result.new_urls = list(new_urls)
+            logger.info(f"Found {len(new_urls)} new URLs in {sitemap_url}")
+            logger.debug(f"New URLs: {new_urls}")
+        else:
+            logger.info(f"No new URLs found in {sitemap_url}")
+        
+        logger.info(f"Checked {sitemap_url}: found {len(current_urls)} URLs, {len(new_urls)} new, {len(removed_urls)} removed")
+        
+    except Exception as e:
+        result.error = str(e)
+        logger.error(f"Error checking sitemap {sitemap_url}: {str(e)}", exc_info=True)
+        if validators:
+            validators.clear()
+    
+    return result, updated_urls, updated_signature
+
+async def check_sitemaps(sitemap_urls: List[str],
+                         configured_urls: Optional[List[str]] = None) -> List[SitemapCheckResult]:
+    """Check sitemaps concurrently for new URLs; configured_urls is the full config when checking a subset"""
+    global last_parsed_cache_prune
+    # File I/O on the known-URLs store is blocking, so it runs in the default executor
+    loop = asyncio.get_running_loop()
+    
+    # Known URLs live in one shard per sitemap; only the signature headers are read
+    # up front, full shards are loaded on demand when a sitemap actually changed
+    await loop.run_in_executor(None, migrate_legacy_known_urls)
+    if time.time() - last_parsed_cache_prune >= PARSED_CACHE_PRUNE_INTERVAL:
+        last_parsed_cache_prune = time.time()
+        await loop.run_in_executor(None, prune_parsed_cache)
+    signatures = {}
+    for sitemap_url in sitemap_urls:
+        signatures[sitemap_url] = await loop.run_in_executor(None, load_known_urls_signature, sitemap_url)
+    http_cache = await loop.run_in_executor(None, load_http_cache)
+    previous_http_cache = {url: dict(entry) for url, entry in http_cache.items()}
+    
+    # One session for the whole run so sub-sitemap recursion reuses pooled keep-alive
+    # connections; the connector limit bounds how many fetches are in flight at once
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_FETCHES)
+    sub_sitemap_cache = {}
+    # Only as many sub-sitemaps in flight as there are connections, so none time out queued
+    sub_sitemap_limit = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        outcomes = await asyncio.gather(
+            *(check_one(session, sitemap_url, signatures[sitemap_url], http_cache, sub_sitemap_cache, sub_sitemap_limit)
+              for sitemap_url in sitemap_urls),
+            return_exceptions=True
+        )
+    
+    # Merge the per-sitemap updates back in one place, remembering which shards changed
+    results = []
+    dirty = {}
+    for sitemap_url, outcome in zip(sitemap_urls, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Error checking sitemap {sitemap_url}: {str(outcome)}")
+            results.append(SitemapCheckResult(
+                sitemap_url=sitemap_url,
+                total_urls=0,
+                new_urls=[],
+                error=str(outcome)
+            ))
+            continue
+        result, updated_urls, updated_signature = outcome
+        if updated_urls is not None:
+            dirty[sitemap_url] = (updated_urls, updated_signature)
         results.append(result)
     
-    # Save updated known URLs only if we've processed all sitemaps without major errors
-    try:
-        if known_urls:
-            save_known_urls(known_urls)
-    except Exception as save_err:
-        logger.error(f"Failed to save known URLs: {str(save_err)}")
+    # Only rewrite the shards whose URL set actually changed; if that fails, drop the
+    # validators too, or the next run would get a 304 and never re-diff the sitemap
+    for sitemap_url, (updated_urls, updated_signature) in dirty.items():
+        if not await loop.run_in_executor(None, save_known_urls, sitemap_url, updated_urls, updated_signature):
+            http_cache.pop(sitemap_url, None)
+    
+    # Forget validators of sitemaps that are no longer configured
+    configured = set(sitemap_urls if configured_urls is None else configured_urls)
+    http_cache = {url: entry for url, entry in http_cache.items() if entry and url in configured}
+    if http_cache != previous_http_cache:
+        await loop.run_in_executor(None, save_http_cache, http_cache)
     
     return results
@@ -0,0 +1,302 @@
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+from collections import Counter
+from io import BytesIO
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sitemap_checker
+
+try:
+    import bot
+except ImportError:  # nextcord is only needed by the bot tests
+    bot = None
+
+
+def urlset(*urls):
+    """Build a <urlset> document listing the given URLs"""
+    locs = ''.join(f'<url><loc>{url}</loc></url>' for url in urls)
+    return f'<?xml version="1.0"?><urlset xmlns="{sitemap_checker.SITEMAP_NS}">{locs}</urlset>'
+
+
+def sitemapindex(*urls):
+    """Build a <sitemapindex> document listing the given sub-sitemaps"""
+    locs = ''.join(f'<sitemap><loc>{url}</loc></sitemap>' for url in urls)
+    return f'<?xml version="1.0"?><sitemapindex xmlns="{sitemap_checker.SITEMAP_NS}">{locs}</sitemapindex>'
+
+
+class KnownUrlsRoundTripTest(unittest.TestCase):
+    """Known URLs extracted from a sitemap must survive a save/load round trip"""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_padded_locs_round_trip(self):
+        sitemap = (
+            '<?xml version="1.0"?>'
+            f'<urlset xmlns="{sitemap_checker.SITEMAP_NS}">'
+            '<url><loc>\n   https://a.example/x\n</loc></url>'
+            '<url><loc> https://a.example/y\t</loc></url>'
+            '<url><loc>https://a.example/z</loc></url>'
+            '<url><loc>\n  \n</loc></url>'
+            '</urlset>'
+        ).encode('utf-8')
+        urls, sub_sitemaps = sitemap_checker.extract_sitemap_locs(BytesIO(sitemap))
+        self.assertEqual(urls, {'https://a.example/x', 'https://a.example/y', 'https://a.example/z'})
+        self.assertEqual(sub_sitemaps, [])
+
+        signature = sitemap_checker.url_set_signature(urls)
+        sitemap_checker.save_known_urls('https://a.example/sitemap.xml', urls, signature)
+        self.assertEqual(sitemap_checker.load_known_urls('https://a.example/sitemap.xml'), urls)
+        self.assertEqual(sitemap_checker.load_known_urls_signature('https://a.example/sitemap.xml'), signature)
+
+    def test_shared_prefix_and_empty_suffix_round_trip(self):
+        urls = {'https://a.example/', 'https://a.example/a', 'https://a.example/b'}
+        sitemap_checker.save_known_urls('https://a.example/sitemap.xml', urls)
+        self.assertEqual(sitemap_checker.load_known_urls('https://a.example/sitemap.xml'), urls)
+
+
+
+class SitemapServerTestCase(unittest.IsolatedAsyncioTestCase):
+    """Runs check_sitemaps against a local aiohttp server in a scratch working directory"""
+
+    async def asyncSetUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        sitemap_checker.discovered_sitemaps.clear()
+        # path -> (body, content type, ETag); anything else is a 404
+        self.pages = {}
+        self.hits = Counter()
+        self.not_modified = Counter()
+        app = web.Application()
+        app.router.add_get('/{path:.*}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        sitemap_checker.discovered_sitemaps.clear()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    async def handle(self, request):
+        self.hits[request.path] += 1
+        if request.path not in self.pages:
+            raise web.HTTPNotFound()
+        body, content_type, etag = self.pages[request.path]
+        if etag and request.headers.get('If-None-Match') == etag:
+            self.not_modified[request.path] += 1
+            return web.Response(status=304)
+        return web.Response(text=body, content_type=content_type, headers={'ETag': etag} if etag else None)
+
+    def serve(self, path, body, content_type='application/xml', etag=None):
+        self.pages[path] = (body, content_type, etag)
+        return self.url(path)
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+
+class ChangeDetectionTest(SitemapServerTestCase):
+    """Unchanged sitemaps are recognised without re-diffing their known URLs"""
+
+    async def test_matching_signature_skips_known_urls_load(self):
+        sitemap_url = self.serve('/sitemap.xml', urlset(self.url('/a'), self.url('/b')))
+        [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        self.assertEqual(len(result.new_urls), 2)
+
+        with mock.patch.object(sitemap_checker, 'load_known_urls', wraps=sitemap_checker.load_known_urls) as load:
+            [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        load.assert_not_called()
+        self.assertEqual((result.total_urls, result.new_urls, result.error), (2, [], ''))
+
+    async def test_not_modified_reports_known_total(self):
+        sitemap_url = self.serve('/sitemap.xml', urlset(self.url('/a'), self.url('/b'), self.url('/c')), etag='"v1"')
+        await sitemap_checker.check_sitemaps([sitemap_url])
+
+        [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        self.assertEqual(self.not_modified['/sitemap.xml'], 1)
+        self.assertEqual((result.total_urls, result.new_urls, result.error), (3, [], ''))
+
+    async def test_new_urls_after_change(self):
+        sitemap_url = self.serve('/sitemap.xml', urlset(self.url('/a')), etag='"v1"')
+        await sitemap_checker.check_sitemaps([sitemap_url])
+
+        self.serve('/sitemap.xml', urlset(self.url('/a'), self.url('/b')), etag='"v2"')
+        [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        self.assertEqual(self.not_modified['/sitemap.xml'], 0)
+        self.assertEqual((result.total_urls, result.new_urls), (2, [self.url('/b')]))
+
+
+class DiscoveryTest(SitemapServerTestCase):
+    """Discovery results are memoised and a probed sitemap body is used as is"""
+
+    async def test_probed_sitemap_is_not_fetched_again(self):
+        sitemap_url = self.serve('/sitemap', urlset(self.url('/a')))
+        [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        self.assertEqual(result.total_urls, 1)
+        self.assertEqual(self.hits['/sitemap'], 1)
+        self.assertEqual(sitemap_checker.discovered_sitemaps[sitemap_url], sitemap_url)
+
+    async def test_discovered_sitemap_is_memoised(self):
+        page_url = self.serve('/sitemap-page', f'<html><a href="/real-sitemap.xml">Sitemap</a></html>', 'text/html')
+        self.serve('/real-sitemap.xml', urlset(self.url('/a'), self.url('/b')), etag='"v1"')
+        [result] = await sitemap_checker.check_sitemaps([page_url])
+        self.assertEqual(result.total_urls, 2)
+        self.assertEqual(sitemap_checker.discovered_sitemaps[page_url], self.url('/real-sitemap.xml'))
+
+        [result] = await sitemap_checker.check_sitemaps([page_url])
+        self.assertEqual(result.total_urls, 2)
+        self.assertEqual(self.hits['/sitemap-page'], 1)
+        self.assertEqual(self.not_modified['/real-sitemap.xml'], 1)
+
+    async def test_xml_url_serving_html_follows_robots_txt(self):
+        sitemap_url = self.serve('/sitemap.xml', '<html><body>Not found</body></html>', 'text/html')
+        self.serve('/robots.txt', f'User-agent: *\nSitemap: {self.url("/real-sitemap.xml")}\n', 'text/plain')
+        self.serve('/real-sitemap.xml', urlset(self.url('/a')))
+        [result] = await sitemap_checker.check_sitemaps([sitemap_url])
+        self.assertEqual((result.total_urls, result.error), (1, ''))
+        self.assertEqual(sitemap_checker.discovered_sitemaps[sitemap_url], self.url('/real-sitemap.xml'))
+
+
+class SubSitemapTest(SitemapServerTestCase):
+    """Sub-sitemaps are fetched once per run and reference cycles terminate"""
+
+    async def test_shared_sub_sitemap_is_fetched_once(self):
+        self.serve('/shared.xml', urlset(self.url('/a'), self.url('/b')))
+        self.serve('/one.xml', urlset(self.url('/one')))
+        self.serve('/two.xml', urlset(self.url('/two')))
+        first = self.serve('/first-index.xml', sitemapindex(self.url('/shared.xml'), self.url('/one.xml')))
+        second = self.serve('/second-index.xml', sitemapindex(self.url('/shared.xml'), self.url('/two.xml')))
+        results = await sitemap_checker.check_sitemaps([first, second])
+        self.assertEqual([result.total_urls for result in results], [3, 3])
+        self.assertEqual(self.hits['/shared.xml'], 1)
+
+    async def test_sub_sitemap_cycle_terminates(self):
+        self.serve('/leaf.xml', urlset(self.url('/a')))
+        index_url = self.serve('/index.xml', sitemapindex(self.url('/nested.xml'), self.url('/leaf.xml')))
+        self.serve('/nested.xml', sitemapindex(self.url('/index.xml'), self.url('/nested.xml')))
+        [result] = await asyncio.wait_for(sitemap_checker.check_sitemaps([index_url]), timeout=10)
+        self.assertEqual((result.total_urls, result.new_urls, result.error), (1, [self.url('/a')], ''))
+
+    async def test_failed_sub_sitemap_keeps_known_urls(self):
+        self.serve('/one.xml', urlset(self.url('/one')))
+        self.serve('/two.xml', urlset(self.url('/two')))
+        index_url = self.serve('/index.xml', sitemapindex(self.url('/one.xml'), self.url('/two.xml')))
+        await sitemap_checker.check_sitemaps([index_url])
+
+        del self.pages['/two.xml']
+        self.serve('/one.xml', urlset(self.url('/one'), self.url('/new')))
+        [result] = await sitemap_checker.check_sitemaps([index_url])
+        self.assertEqual(result.new_urls, [self.url('/new')])
+        self.assertIn(self.url('/two.xml'), result.error)
+
+        self.serve('/two.xml', urlset(self.url('/two')))
+        [result] = await sitemap_checker.check_sitemaps([index_url])
+        self.assertEqual((result.total_urls, result.new_urls, result.error), (3, [], ''))
+
+
+@unittest.skipIf(bot is None, "nextcord is not installed")
+class ScheduleNextCheckTest(unittest.TestCase):
+    """Unchanged sitemaps back off up to the cap; new URLs or errors reset the interval"""
+
+    def setUp(self):
+        bot.next_check_at.clear()
+        bot.check_intervals.clear()
+
+    def tearDown(self):
+        bot.next_check_at.clear()
+        bot.check_intervals.clear()
+
+    def check(self, new_urls=(), error=''):
+        bot.schedule_next_check(sitemap_checker.SitemapCheckResult('https://a.example/sitemap.xml', 1, list(new_urls), error))
+        return bot.check_intervals['https://a.example/sitemap.xml']
+
+    def test_backoff_is_capped(self):
+        interval = bot.CHECK_INTERVAL
+        for _ in range(10):
+            interval = min(interval * bot.CHECK_BACKOFF_FACTOR, bot.MAX_CHECK_INTERVAL)
+            self.assertEqual(self.check(), interval)
+        self.assertEqual(interval, bot.MAX_CHECK_INTERVAL)
+
+    def test_new_urls_and_errors_reset_interval(self):
+        self.check()
+        self.check()
+        self.assertEqual(self.check(new_urls=['https://a.example/new']), bot.CHECK_INTERVAL)
+        self.check()
+        self.assertEqual(self.check(error='boom'), bot.CHECK_INTERVAL)
+
+    def test_next_check_is_jittered_within_bounds(self):
+        with mock.patch.object(bot.time, 'monotonic', return_value=1000.0):
+            interval = self.check()
+        delay = bot.next_check_at['https://a.example/sitemap.xml'] - 1000.0
+        self.assertGreaterEqual(delay, interval)
+        self.assertLessEqual(delay, interval * (1 + bot.CHECK_JITTER_FRACTION))
+
+
+class FakeChannel:
+    """Records what send_aggregate_notification sends"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, embed=None, files=None):
+        self.messages.append((content, embed, files or []))
+
+
+@unittest.skipIf(bot is None, "nextcord is not installed")
+class AggregateNotificationTest(unittest.IsolatedAsyncioTestCase):
+    """Notifications are split to stay within Discord's embed and attachment limits"""
+
+    def results(self, count, urls_each, url_length=20):
+        return [sitemap_checker.SitemapCheckResult(
+                    f'https://site{i}.example/sitemap.xml', urls_each,
+                    [f'https://site{i}.example/{j:0{url_length}d}' for j in range(urls_each)])
+                for i in range(count)]
+
+    async def test_nothing_new_sends_nothing(self):
+        channel = FakeChannel()
+        await bot.send_aggregate_notification(channel, self.results(3, 0))
+        self.assertEqual(channel.messages, [])
+
+    async def test_fields_and_files_are_batched(self):
+        channel = FakeChannel()
+        count = bot.EMBED_FIELD_LIMIT + 5
+        await bot.send_aggregate_notification(channel, self.results(count, bot.MAX_URLS_TO_DISPLAY + 1, url_length=1))
+
+        embeds = [embed for _, embed, _ in channel.messages if embed is not None]
+        self.assertEqual([len(embed.fields) for embed in embeds], [bot.EMBED_FIELD_LIMIT, 5])
+        self.assertEqual(embeds[0].footer.text, "Part 1 of 2")
+        self.assertTrue(all(len(files) <= bot.MAX_FILES_PER_MESSAGE for _, _, files in channel.messages))
+        self.assertEqual(sum(len(files) for _, _, files in channel.messages), count)
+        # Overflow attachments follow their embed as file-only messages
+        self.assertEqual([(embed is not None, len(files)) for _, embed, files in channel.messages],
+                         [(True, 10), (False, 10), (False, 5), (True, 5)])
+
+    async def test_embed_stays_under_total_char_limit(self):
+        channel = FakeChannel()
+        await bot.send_aggregate_notification(channel, self.results(12, bot.MAX_URLS_TO_DISPLAY, url_length=150))
+
+        embeds = [embed for _, embed, _ in channel.messages]
+        self.assertGreater(len(embeds), 1)
+        self.assertEqual(sum(len(embed.fields) for embed in embeds), 12)
+        self.assertTrue(all(len(embed) <= bot.EMBED_TOTAL_CHAR_LIMIT for embed in embeds))
+        self.assertTrue(all(not files for _, _, files in channel.messages))
+
+
+if __name__ == '__main__':
+    unittest.main()